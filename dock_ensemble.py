@@ -0,0 +1,228 @@
+import csv
+import os
+import shutil
+import tempfile
+from get_tool_path import get_tool_path
+from process_runner import ProcessRunner
+from prepare_receptor import (prepare_receptor, extract_ligand_from_pdb,
+                              calculate_binding_site_center, calculate_box_size)
+from run_vina import VINA_TIMEOUT, build_vina_command, parse_best_affinity
+from shard_archive import list_inputs, iter_inputs, STAGE_CHUNK
+from job_cost import CostModel, LongestFirstQueue, pdbqt_features
+
+MAPS_TIMEOUT = 1800
+
+
+def ensemble_box(reference_pdb):
+    """
+    由参考受体中的共晶配体确定整个集合共用的对接盒子，返回 (中心, 大小)
+    """
+    ligand_atoms = extract_ligand_from_pdb(reference_pdb)
+    if ligand_atoms is None:
+        raise Exception(f"参考受体中未找到配体，无法确定对接盒子: {reference_pdb}，"
+                        "请指定其他参考受体或盒子中心和大小")
+    center = [float(c) for c in calculate_binding_site_center(ligand_atoms)]
+    return center, calculate_box_size(ligand_atoms)
+
+
+def prepare_ensemble(pdb_files, output_dir="ensemble", center=None, size=None, reference=None):
+    """
+    准备受体构象集合：每个PDB生成 output_dir/<受体名>/ 下的PDBQT和vina.conf
+    - 所有受体使用同一个对接盒子，各受体的结合能才可比较：
+      优先使用给定的center和size，否则取参考受体（默认第一个）中配体的范围；
+      受体构象需在同一坐标系中（已叠合）
+    - 受体名取PDB文件名，重名时报错（结果目录和汇总列以受体名区分）
+    返回 [(受体名, 配置文件)]
+    """
+    names = [os.path.splitext(os.path.basename(f))[0] for f in pdb_files]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise Exception(f"受体文件名重复: {', '.join(duplicates)}，请重命名后再运行")
+
+    if center is None or size is None:
+        ref_center, ref_size = ensemble_box(reference or pdb_files[0])
+        center = ref_center if center is None else center
+        size = ref_size if size is None else size
+
+    receptors = []
+    for pdb_file, name in zip(pdb_files, names):
+        result = prepare_receptor(pdb_file, os.path.join(output_dir, name),
+                                  center=center, size=size)
+        receptors.append((name, result['conf_file']))
+    return receptors
+
+
+def write_vina_maps(vina_path, receptors, runner, timeout=MAPS_TIMEOUT):
+    """
+    为每个受体预先计算一次vina格点（需要Vina 1.2及以上），
+    之后该受体的所有配体通过 --maps 复用格点而不是各自重新计算
+    返回 {受体名: (无receptor行的配置文件, 格点前缀)}
+    """
+    jobs = []
+    maps = {}
+    for name, conf_file in receptors:
+        receptor_dir = os.path.dirname(conf_file)
+        prefix = os.path.join(receptor_dir, f"{name}_maps")
+        maps_conf = os.path.join(receptor_dir, f"{name}_maps.conf")
+        with open(conf_file) as f:
+            lines = f.readlines()
+        receptor_pdbqt = None
+        with open(maps_conf, 'w') as f:
+            for line in lines:
+                if line.split("=")[0].strip() == "receptor":
+                    receptor_pdbqt = line.split("=", 1)[1].strip()
+                else:
+                    f.write(line)
+        jobs.append((name, [vina_path, "--config", maps_conf, "--receptor", receptor_pdbqt,
+                            "--write_maps", prefix, "--force_even_voxels"]))
+        maps[name] = (maps_conf, prefix)
+
+    for (name, _), result in zip(jobs, runner.run_all_sync(jobs, timeout=timeout)):
+        if not result.ok:
+            raise Exception(f"{name} 格点计算失败: {result.stderr.strip()}")
+        print(f"[OK] 格点: {name}")
+    return maps
+
+
+def dock_ensemble(receptors, ligand_dir="pdbqt", out_dir="ensemble_results",
+                  concurrency=None, cpu=None, timeout=VINA_TIMEOUT, runner=None,
+                  use_maps=False, order_by_cost=True, on_result=None):
+    """
+    将配体库对接到受体构象集合中的每个受体：
+    - 所有 (受体, 配体) 任务共用一个运行器，并发使用全部CPU
+    - 任务按受体分组（受体优先顺序），同一受体内空闲进程取当前估计耗时最长的配体，
+      耗时模型在运行中根据实测时间更新（use_maps 时单独记录为 vina_maps）；
+      use_maps 时每个受体的格点只计算一次并被其所有配体复用
+    - 结果写入 out_dir/<受体名>/，每个配体在所有受体中的最佳结合能
+      汇总到 out_dir/ensemble_best.csv
+    receptors: [(受体名, vina.conf)]，可由prepare_ensemble生成
+    返回 {配体名: {受体名: 最佳结合能}}
+    """
+    vina_path = get_tool_path('vina')
+    if not vina_path:
+        raise Exception("未找到AutoDock Vina路径，请在步骤1中配置工具路径")
+
+    runner = runner or ProcessRunner(concurrency, timeout)
+    if cpu is None:
+        cpu = max(1, (os.cpu_count() or 1) // runner.max_concurrency)
+
+    maps = write_vina_maps(vina_path, receptors, runner) if use_maps else {}
+
+    items, reader = list_inputs(ligand_dir, ".pdbqt")
+    model = CostModel('vina_maps' if use_maps else 'vina') if order_by_cost else None
+    stage_dir = tempfile.mkdtemp() if reader else None
+    conf_files = dict(receptors)
+    queue = LongestFirstQueue(iter_inputs(items, reader, stage_dir), model, pdbqt_features,
+                              groups=list(conf_files), window=STAGE_CHUNK if reader else None)
+
+    for name, _ in receptors:
+        os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+
+    scores = {}
+
+    def next_job():
+        job = queue.pop()
+        if job is None:
+            return None
+        receptor, ligand, lig_file = job
+        receptor_out = os.path.join(out_dir, receptor)
+        if receptor in maps:
+            maps_conf, prefix = maps[receptor]
+            _, cmd = build_vina_command(vina_path, maps_conf, lig_file, receptor_out, cpu, ligand)
+            cmd += ["--maps", prefix]
+        else:
+            _, cmd = build_vina_command(vina_path, conf_files[receptor], lig_file,
+                                        receptor_out, cpu, ligand)
+        return (receptor, ligand), cmd
+
+    def on_done(key, result):
+        receptor, ligand = key
+        out_file = os.path.join(out_dir, receptor, f"{ligand}_out.pdbqt")
+        ok = result.ok and os.path.exists(out_file)
+        staged = queue.finish(ligand, result.elapsed if ok else None)
+        if stage_dir and staged:
+            os.remove(staged)
+        if result.cancelled:
+            return
+        affinity = None
+        if ok:
+            affinity = parse_best_affinity(out_file)
+            print(f"[OK] {receptor}/{ligand} {affinity} kcal/mol ({result.elapsed:.1f}s)")
+        else:
+            if result.ok:
+                reason = "未生成输出文件"
+            else:
+                reason = "超时" if result.timed_out else result.stderr.strip()
+            print(f"[FAIL] {receptor}/{ligand}: {reason}")
+        scores.setdefault(ligand, {})[receptor] = affinity
+        if on_result:
+            on_result(receptor, ligand, affinity, result)
+
+    try:
+        runner.run_pull_sync(next_job, on_done=on_done)
+    finally:
+        if stage_dir:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        if model and model.samples:
+            model.save()
+
+    write_ensemble_summary(scores, [name for name, _ in receptors],
+                           os.path.join(out_dir, "ensemble_best.csv"))
+    return scores
+
+
+def write_ensemble_summary(scores, receptor_names, summary_file):
+    """
+    合并结果：每个配体在所有受体中的最佳结合能及对应受体，按最佳结合能排序
+    """
+    rows = []
+    for ligand, per_receptor in scores.items():
+        valid = {r: a for r, a in per_receptor.items() if a is not None}
+        best_receptor = min(valid, key=valid.get) if valid else None
+        row = {
+            'ligand': ligand,
+            'best_affinity': valid[best_receptor] if best_receptor else None,
+            'best_receptor': best_receptor,
+        }
+        for name in receptor_names:
+            row[name] = per_receptor.get(name)
+        rows.append(row)
+
+    rows.sort(key=lambda r: (r['best_affinity'] is None, r['best_affinity'] or 0.0))
+    with open(summary_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['ligand', 'best_affinity', 'best_receptor'] + receptor_names)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"[OK] 集合对接汇总: {summary_file}")
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 4:
+        print("用法: python dock_ensemble.py <配体目录> <输出目录> <受体1.pdb> [受体2.pdb ...] "
+              "[--maps] [--ref=参考受体.pdb] [--center=x,y,z --size=x,y,z]")
+        sys.exit(1)
+
+    def vector_option(key):
+        for arg in sys.argv[3:]:
+            if arg.startswith(f"--{key}="):
+                return [float(v) for v in arg.split("=", 1)[1].split(",")]
+        return None
+
+    ligand_dir = sys.argv[1]
+    out_dir = sys.argv[2]
+    pdb_files = [a for a in sys.argv[3:] if not a.startswith("--")]
+    use_maps = "--maps" in sys.argv[3:]
+    reference = next((a.split("=", 1)[1] for a in sys.argv[3:] if a.startswith("--ref=")), None)
+
+    try:
+        center, size = vector_option("center"), vector_option("size")
+        receptors = prepare_ensemble(pdb_files, os.path.join(out_dir, "receptors"),
+                                     center=center, size=size, reference=reference)
+        scores = dock_ensemble(receptors, ligand_dir, out_dir, use_maps=use_maps)
+        print(f"\n集合对接完成: {len(receptors)} 个受体, {len(scores)} 个配体")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        sys.exit(1)
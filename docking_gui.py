@@ -1,9 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import subprocess
+import contextlib
 import os
+import queue
 import threading
+import time
 from tool_detector import ToolDetector
+from prepare_receptor import prepare_receptor
+from smile_to_sdf import smiles_to_sdf, N_CONFS
+from sdf_to_pdbqt import convert_sdf_dir
+from run_vina import run_vina
+from process_runner import ProcessRunner
+from shard_archive import list_inputs
+
+LEADERBOARD_SIZE = 50
+LEADERBOARD_POLL_MS = 500
 
 class MolecularDockingGUI:
     def __init__(self, root):
@@ -20,6 +31,14 @@ class MolecularDockingGUI:
         self.tool_status_labels = {}
         self.tool_status_vars = {}
         
+        self.docking_runner = None
+        self.docking_events = queue.Queue()
+        self.leaderboard = []
+        self.leaderboard_sort = ('affinity', False)
+        self.docking_start = None
+        self.docking_done = 0
+        self.docking_total = 0
+        
         self.setup_ui()
         
     def setup_ui(self):
@@ -212,9 +231,35 @@ class MolecularDockingGUI:
         info_text = """
 此步骤将使用AutoDock Vina进行分子对接。
 对接参数已在步骤2中自动生成（vina.conf文件）。
+对接过程中下方实时显示结合能最好的配体，可随时停止对接。
         """
         ttk.Label(self.content_frame, text=info_text, justify=tk.LEFT).pack(anchor=tk.W, pady=10)
         
+        board_frame = ttk.Frame(self.content_frame)
+        board_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        columns = ('rank', 'ligand', 'affinity')
+        self.leaderboard_tree = ttk.Treeview(board_frame, columns=columns, show='headings', height=8)
+        headings = {'rank': "排名", 'ligand': "配体", 'affinity': "结合能 (kcal/mol)"}
+        for col in columns:
+            self.leaderboard_tree.heading(col, text=headings[col], command=lambda c=col: self.sort_leaderboard(c))
+        self.leaderboard_tree.column('rank', width=60, anchor=tk.CENTER)
+        self.leaderboard_tree.column('ligand', width=300)
+        self.leaderboard_tree.column('affinity', width=150, anchor=tk.CENTER)
+        self.leaderboard_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        scrollbar = ttk.Scrollbar(board_frame, orient=tk.VERTICAL, command=self.leaderboard_tree.yview)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self.leaderboard_tree.configure(yscrollcommand=scrollbar.set)
+        
+        status_frame = ttk.Frame(self.content_frame)
+        status_frame.pack(fill=tk.X, pady=5)
+        
+        self.docking_status = tk.StringVar(value="未开始")
+        ttk.Label(status_frame, textvariable=self.docking_status).pack(side=tk.LEFT, padx=5)
+        ttk.Button(status_frame, text="停止对接", command=self.stop_docking).pack(side=tk.RIGHT, padx=5)
+        
+        self.refresh_leaderboard()
         self.setup_navigation_buttons()
         
     def setup_navigation_buttons(self):
@@ -350,21 +395,9 @@ class MolecularDockingGUI:
         if not os.path.exists(pdb_file):
             raise Exception(f"文件不存在: {pdb_file}")
         
-        self.log_message("运行 prepare_receptor.py...")
-        
-        result = subprocess.run(
-            ["python", "prepare_receptor.py", pdb_file, "."],
-            capture_output=True,
-            text=True,
-            cwd=os.getcwd()
-        )
+        self.log_message("准备受体...")
         
-        self.log_message(result.stdout)
-        if result.stderr:
-            self.log_message(f"警告: {result.stderr}")
-            
-        if result.returncode != 0:
-            raise Exception("受体准备失败")
+        self.run_logged(prepare_receptor, pdb_file, ".")
         
         self.log_message("受体准备完成!")
         
@@ -380,69 +413,153 @@ class MolecularDockingGUI:
         self.log_message("准备完成，可以进行下一步")
         
     def execute_step4(self):
-        self.log_message("运行 smile_to_sdf.py...")
+        self.log_message("生成配体构象...")
         
         if not os.path.exists("ligands.smi"):
             raise Exception("找不到 ligands.smi 文件，请先完成步骤3")
         
-        result = subprocess.run(
-            ["python", "smile_to_sdf.py"],
-            capture_output=True,
-            text=True,
-            cwd=os.getcwd()
-        )
-        
-        self.log_message(result.stdout)
-        if result.stderr:
-            self.log_message(f"警告: {result.stderr}")
+        ok, fail = self.run_logged(smiles_to_sdf, "ligands.smi", "sdf", N_CONFS)
+        self.log_message(f"转换完成: 成功 {ok} 个, 失败 {fail} 个")
             
-        if result.returncode != 0:
+        if not ok:
             raise Exception("转换失败")
             
     def execute_step5(self):
-        self.log_message("运行 sdf_to_pdbqt.bat...")
+        self.log_message("运行 OpenBabel 转换 (并发)...")
         
         if not os.path.exists("sdf"):
             raise Exception("找不到 sdf 目录，请先完成步骤4")
         
-        result = subprocess.run(
-            ["sdf_to_pdbqt.bat"],
-            capture_output=True,
-            text=True,
-            cwd=os.getcwd(),
-            shell=True
-        )
-        
-        self.log_message(result.stdout)
-        if result.stderr:
-            self.log_message(f"警告: {result.stderr}")
+        ok, fail = self.run_logged(convert_sdf_dir, "sdf", "pdbqt")
+        self.log_message(f"转换完成: 成功 {ok} 个, 失败 {fail} 个")
             
-        if result.returncode != 0:
+        if fail and not ok:
             raise Exception("转换失败")
             
     def execute_step6(self):
-        self.log_message("运行 run_vina.bat...")
+        self.log_message("运行 AutoDock Vina (并发)...")
         
         if not os.path.exists("vina.conf"):
             raise Exception("找不到 vina.conf 文件，请先完成步骤2")
         if not os.path.exists("pdbqt"):
             raise Exception("找不到 pdbqt 目录，请先完成步骤5")
         
-        result = subprocess.run(
-            ["run_vina.bat"],
-            capture_output=True,
-            text=True,
-            cwd=os.getcwd(),
-            shell=True
-        )
+        total = len(list_inputs("pdbqt", ".pdbqt")[0])
+        self.leaderboard = []
+        self.docking_runner = ProcessRunner()
+        self.docking_events.put(('start', total, time.time()))
+        self.root.after(0, self.poll_docking_events)
+        
+        def on_result(name, affinity, result):
+            self.docking_events.put(('result', name, affinity))
         
-        self.log_message(result.stdout)
-        if result.stderr:
-            self.log_message(f"警告: {result.stderr}")
+        try:
+            ok, fail = self.run_logged(run_vina, "pdbqt", "docking_results", "vina.conf",
+                                       runner=self.docking_runner, on_result=on_result)
+        finally:
+            stopped = self.docking_runner.stopped
+            self.docking_events.put(('end', stopped))
+            self.docking_runner = None
+        
+        if stopped:
+            self.log_message(f"对接已停止: 成功 {ok} 个, 失败 {fail} 个")
+        else:
+            self.log_message(f"对接完成: 成功 {ok} 个, 失败 {fail} 个")
             
-        if result.returncode != 0:
+        if fail and not ok:
             raise Exception("对接失败")
             
+    def stop_docking(self):
+        if self.docking_runner is not None:
+            self.log_message("正在停止对接...")
+            self.docking_runner.stop()
+            
+    def poll_docking_events(self):
+        """
+        在主线程中处理对接结果事件，增量更新排行榜和吞吐量
+        """
+        running = True
+        changed = False
+        while True:
+            try:
+                event = self.docking_events.get_nowait()
+            except queue.Empty:
+                break
+            
+            if event[0] == 'start':
+                self.docking_total, self.docking_start = event[1], event[2]
+                self.docking_done = 0
+                changed = True
+            elif event[0] == 'result':
+                self.docking_done += 1
+                self.add_to_leaderboard(event[1], event[2])
+                changed = True
+            elif event[0] == 'end':
+                running = False
+        
+        if changed or not running:
+            self.refresh_leaderboard(running)
+        if running:
+            self.root.after(LEADERBOARD_POLL_MS, self.poll_docking_events)
+            
+    def add_to_leaderboard(self, name, affinity):
+        if affinity is None:
+            return
+        board = self.leaderboard
+        if len(board) >= LEADERBOARD_SIZE and affinity >= board[-1][0]:
+            return
+        i = len(board)
+        while i > 0 and board[i - 1][0] > affinity:
+            i -= 1
+        board.insert(i, (affinity, name))
+        del board[LEADERBOARD_SIZE:]
+        
+    def sort_leaderboard(self, column):
+        key, reverse = self.leaderboard_sort
+        self.leaderboard_sort = (column, not reverse if key == column else False)
+        self.refresh_leaderboard()
+        
+    def refresh_leaderboard(self, running=True):
+        if not hasattr(self, 'leaderboard_tree') or not self.leaderboard_tree.winfo_exists():
+            return
+        
+        rows = [(rank, name, affinity) for rank, (affinity, name) in enumerate(self.leaderboard, 1)]
+        key, reverse = self.leaderboard_sort
+        index = {'rank': 0, 'ligand': 1, 'affinity': 2}[key]
+        rows.sort(key=lambda r: r[index], reverse=reverse)
+        
+        tree = self.leaderboard_tree
+        tree.delete(*tree.get_children())
+        for rank, name, affinity in rows:
+            tree.insert('', tk.END, values=(rank, name, f"{affinity:.2f}"))
+        
+        if self.docking_start is None:
+            return
+        elapsed = max(time.time() - self.docking_start, 1e-6)
+        rate = self.docking_done / elapsed * 60
+        state = "运行中" if running else "已结束"
+        self.docking_status.set(
+            f"{state}: {self.docking_done}/{self.docking_total} 个配体, "
+            f"{rate:.1f} 个/分钟, 用时 {elapsed:.0f}s"
+        )
+            
+    def run_logged(self, func, *args, **kwargs):
+        """
+        运行函数，并将其print输出逐行写入运行日志
+        """
+        gui = self
+
+        class LogWriter:
+            def write(self, text):
+                if text.strip():
+                    gui.log_message(text.rstrip("\n"))
+
+            def flush(self):
+                pass
+
+        with contextlib.redirect_stdout(LogWriter()):
+            return func(*args, **kwargs)
+            
     def log_message(self, message):
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
@@ -0,0 +1,236 @@
+import heapq
+import json
+import os
+from shard_archive import STAGE_CHUNK
+
+COST_MODEL_FILE = 'cost_model.json'
+
+# 先验系数: 耗时(秒) ≈ c0 + c1*f1 + c2*f2 + c3*f1*f2
+DEFAULT_COEFS = {
+    'vina': [2.0, 1.0, 0.1, 0.05],    # f1=TORSDOF, f2=原子数
+    'vina_maps': [0.5, 1.0, 0.1, 0.05],  # 复用预计算格点(--maps)，不含格点计算时间
+    'obabel': [0.2, 0.02, 0.005, 0.0005],  # f1=构象数, f2=原子数
+}
+PRIOR_WEIGHT = 1.0
+REFIT_MIN = 20
+
+
+def pdbqt_features(text):
+    """
+    PDBQT的耗时特征: (TORSDOF, 原子数)
+    """
+    torsdof, atoms = 0, 0
+    for line in text.splitlines():
+        if line.startswith(("ATOM", "HETATM")):
+            atoms += 1
+        elif line.startswith("TORSDOF"):
+            try:
+                torsdof = int(line.split()[1])
+            except (ValueError, IndexError):
+                pass
+        elif line.startswith("ENDMDL"):
+            break
+    return torsdof, atoms
+
+
+def sdf_features(text):
+    """
+    SDF的耗时特征: (构象数, 原子数)
+    """
+    lines = text.splitlines()
+    atoms = 0
+    if len(lines) > 3:
+        try:
+            atoms = int(lines[3][:3])
+        except ValueError:
+            pass
+    records = sum(1 for line in lines if line.startswith("$$$$"))
+    return max(records, 1), atoms
+
+
+def solve(matrix, vector):
+    """
+    高斯消元求解小规模线性方程组
+    """
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-12:
+            return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(n):
+            if r != col:
+                factor = a[r][col] / a[col][col]
+                for c in range(col, n + 1):
+                    a[r][c] -= factor * a[col][c]
+    return [a[i][n] / a[i][i] for i in range(n)]
+
+
+class CostModel:
+    """
+    线性耗时模型，根据实测耗时在线更新（向先验系数收缩的非负回归），
+    结果保存在cost_model.json中供下次运行使用
+    """
+    def __init__(self, stage, config_file=COST_MODEL_FILE):
+        self.stage = stage
+        self.config_file = config_file
+        self.prior = list(DEFAULT_COEFS[stage])
+        n = len(self.prior)
+        self.xtx = [[0.0] * n for _ in range(n)]
+        self.xty = [0.0] * n
+        self.samples = 0
+        self.coefs = list(self.prior)
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    state = json.load(f).get(self.stage)
+                if state:
+                    self.xtx = state['xtx']
+                    self.xty = state['xty']
+                    self.samples = state['samples']
+                    self.fit()
+            except:
+                pass
+
+    def save(self):
+        config = {}
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+            except:
+                config = {}
+        config[self.stage] = {
+            'xtx': self.xtx,
+            'xty': self.xty,
+            'samples': self.samples,
+            'coefs': self.coefs,
+        }
+        with open(self.config_file, 'w') as f:
+            json.dump(config, f, indent=2)
+
+    @staticmethod
+    def design(features):
+        f1, f2 = features
+        return [1.0, float(f1), float(f2), float(f1) * float(f2)]
+
+    def estimate(self, features):
+        x = self.design(features)
+        return max(sum(c * v for c, v in zip(self.coefs, x)), 0.0)
+
+    def observe(self, features, seconds):
+        x = self.design(features)
+        for i, xi in enumerate(x):
+            self.xty[i] += xi * seconds
+            for j, xj in enumerate(x):
+                self.xtx[i][j] += xi * xj
+        self.samples += 1
+
+    def fit(self):
+        """
+        带先验的非负最小二乘：先验相当于PRIOR_WEIGHT个平均样本，
+        系数保持非负，使估计耗时随扭转数和原子数单调增加
+        """
+        if not self.samples:
+            return self.coefs
+
+        active = list(range(len(self.prior)))
+        while active:
+            lam = {i: PRIOR_WEIGHT * max(self.xtx[i][i] / self.samples, 1e-9) for i in active}
+            matrix = [[self.xtx[i][j] + (lam[i] if i == j else 0.0) for j in active]
+                      for i in active]
+            vector = [self.xty[i] + lam[i] * self.prior[i] for i in active]
+            solution = solve(matrix, vector)
+            if solution is None:
+                return self.coefs
+
+            negative = [(c, i) for c, i in zip(solution, active) if c < 0]
+            if not negative:
+                self.coefs = [0.0] * len(self.prior)
+                for c, i in zip(solution, active):
+                    self.coefs[i] = c
+                break
+            active.remove(min(negative)[1])
+        return self.coefs
+
+
+class LongestFirstQueue:
+    """
+    动态LPT调度：每次取出等待任务中当前模型估计耗时最长的一个
+    - 输入从 staged（iter_inputs产出的 (名称, 本地文件, 文本)）逐个读入，
+      等待中的配体不超过 window 个（None 表示全部读入），特征在读入时计算
+    - 每个配体对每个 group 生成一个任务，按 group 顺序优先（如集合对接的受体）
+    - 完成数每翻一倍（至少REFIT_MIN个）用实测耗时重新拟合模型并重排等待任务，
+      同一次运行内后续任务即使用更新后的估计
+    model 为None时按输入顺序调度
+    """
+    def __init__(self, staged, model, feature_fn, groups=(None,), window=STAGE_CHUNK):
+        self.staged = iter(staged)
+        self.model = model
+        self.feature_fn = feature_fn
+        self.groups = list(groups)
+        self.window = window
+        self.features = {}
+        self.files = {}
+        self.pending = {}
+        self.heap = []
+        self.seq = 0
+        self.done = 0
+        self.fitted_at = 0
+
+    def priority(self, group_index, name):
+        cost = self.model.estimate(self.features[name]) if self.model else 0.0
+        return group_index, -cost
+
+    def fill(self):
+        while self.window is None or len(self.files) < self.window:
+            try:
+                name, local_file, text = next(self.staged)
+            except StopIteration:
+                return
+            try:
+                self.features[name] = self.feature_fn(text)
+            except (ValueError, IndexError):
+                self.features[name] = (0, 0)
+            self.files[name] = local_file
+            self.pending[name] = len(self.groups)
+            for i in range(len(self.groups)):
+                heapq.heappush(self.heap, (*self.priority(i, name), self.seq, i, name))
+                self.seq += 1
+
+    def pop(self):
+        """
+        返回 (group, 名称, 本地文件)，没有任务时返回None
+        """
+        self.fill()
+        if not self.heap:
+            return None
+        *_, group_index, name = heapq.heappop(self.heap)
+        return self.groups[group_index], name, self.files[name]
+
+    def finish(self, name, seconds=None):
+        """
+        标记一个任务完成，seconds 为实测耗时（失败时为None不计入模型）；
+        该配体的所有任务都完成时返回其本地文件，供调用方删除临时文件
+        """
+        if self.model and seconds is not None:
+            self.model.observe(self.features[name], seconds)
+            self.done += 1
+            if self.done >= max(REFIT_MIN, 2 * self.fitted_at):
+                self.refit()
+        self.pending[name] -= 1
+        if self.pending[name]:
+            return None
+        del self.pending[name], self.features[name]
+        return self.files.pop(name)
+
+    def refit(self):
+        self.model.fit()
+        self.fitted_at = self.done
+        self.heap = [(*self.priority(i, name), seq, i, name)
+                     for *_, seq, i, name in self.heap]
+        heapq.heapify(self.heap)
@@ -0,0 +1,204 @@
+DEFAULT_LIMITS = {
+    'min_heavy_atoms': 6,
+    'max_heavy_atoms': 60,
+    'max_mw': 600.0,
+    'max_rotatable_bonds': 12,
+    'max_abs_charge': 2,
+}
+
+# 反应性/干扰性子结构警示 (名称 -> SMARTS)
+DEFAULT_ALERTS = {
+    'acyl_halide': '[CX3](=O)[Cl,Br,I]',
+    'sulfonyl_halide': 'S(=O)(=O)[Cl,Br,I]',
+    'aldehyde': '[CX3H1](=O)[#6]',
+    'epoxide': 'C1OC1',
+    'aziridine': 'C1NC1',
+    'isocyanate': 'N=C=O',
+    'isothiocyanate': 'N=C=S',
+    'azide': 'N=[N+]=[N-]',
+    'diazo': '[CX3]=[N+]=[N-]',
+    'peroxide': 'OO',
+    'michael_acceptor_ketone': '[CH2]=[CH]C(=O)',
+    'thiol': '[SX2H1]',
+    'heavy_metal': '[Hg,Pb,Sn,As,Sb,Se,Te,Tl,Cd]',
+}
+
+
+def strip_salts(mol):
+    """
+    去除盐和溶剂：保留重原子数最多的片段
+    """
+    from rdkit import Chem
+    from rdkit.Chem import Descriptors
+
+    frags = Chem.GetMolFrags(mol, asMols=True, sanitizeFrags=True)
+    if len(frags) <= 1:
+        return mol
+    return max(frags, key=lambda m: (m.GetNumHeavyAtoms(), Descriptors.MolWt(m)))
+
+
+def molecule_key(mol, dedup_by='smiles'):
+    """
+    生成去重用的分子标识：规范SMILES 或 InChIKey
+    """
+    from rdkit import Chem
+
+    if dedup_by == 'inchikey':
+        key = Chem.MolToInchiKey(mol)
+        if key:
+            return key
+    return Chem.MolToSmiles(mol)
+
+
+def compile_alerts(alerts):
+    """
+    将SMARTS警示编译为查询分子
+    """
+    from rdkit import Chem
+
+    compiled = {}
+    for name, smarts in alerts.items():
+        patt = Chem.MolFromSmarts(smarts)
+        if patt is None:
+            raise Exception(f"无效的SMARTS警示 {name}: {smarts}")
+        compiled[name] = patt
+    return compiled
+
+
+def check_properties(mol, limits, alerts):
+    """
+    检查分子性质，返回拒绝原因；通过时返回None
+    """
+    from rdkit import Chem
+    from rdkit.Chem import Descriptors, rdMolDescriptors
+
+    heavy = mol.GetNumHeavyAtoms()
+    if heavy < limits['min_heavy_atoms']:
+        return f"heavy_atoms={heavy}<{limits['min_heavy_atoms']}"
+    if heavy > limits['max_heavy_atoms']:
+        return f"heavy_atoms={heavy}>{limits['max_heavy_atoms']}"
+
+    mw = Descriptors.MolWt(mol)
+    if mw > limits['max_mw']:
+        return f"mw={mw:.1f}>{limits['max_mw']}"
+
+    rot = rdMolDescriptors.CalcNumRotatableBonds(mol)
+    if rot > limits['max_rotatable_bonds']:
+        return f"rotatable_bonds={rot}>{limits['max_rotatable_bonds']}"
+
+    charge = Chem.GetFormalCharge(mol)
+    if abs(charge) > limits['max_abs_charge']:
+        return f"charge={charge}"
+
+    for name, patt in alerts.items():
+        if mol.HasSubstructMatch(patt):
+            return f"alert:{name}"
+
+    return None
+
+
+def read_smiles_file(input_file):
+    """
+    逐行读取SMILES文件，返回 (SMILES, 名称)
+    """
+    with open(input_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            parts = line.strip().split()
+            smiles = parts[0]
+            name = parts[1] if len(parts) > 1 else smiles.replace("/", "_")
+            yield smiles, name
+
+
+def filter_ligands(records, rejects_file=None, limits=None, alerts=None,
+                   dedup_by='smiles', batch_size=1000):
+    """
+    在构象生成前预过滤配体：
+    1. 去除盐
+    2. 按规范SMILES或InChIKey去重
+    3. 按重原子数、分子量、可旋转键、电荷和子结构警示过滤
+    被拒绝的分子连同原因写入rejects_file（重复分子的第一个副本被拒绝时，
+    重复项记录该原因和第一个副本的名称）；通过的分子按批次产出
+    (SMILES, 名称, 分子)
+    """
+    from rdkit import Chem
+
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    alerts = compile_alerts(DEFAULT_ALERTS if alerts is None else alerts)
+
+    seen = {}
+    rejects = open(rejects_file, 'w') if rejects_file else None
+    stats = {'total': 0, 'passed': 0, 'rejected': 0}
+
+    def reject(smiles, name, reason):
+        stats['rejected'] += 1
+        if rejects:
+            rejects.write(f"{smiles}\t{name}\t{reason}\n")
+
+    def process_batch(batch):
+        passed = []
+        for smiles, name in batch:
+            stats['total'] += 1
+
+            mol = Chem.MolFromSmiles(smiles)
+            if mol is None:
+                reject(smiles, name, "parse_error")
+                continue
+
+            mol = strip_salts(mol)
+            key = molecule_key(mol, dedup_by)
+            if key in seen:
+                first, first_reason = seen[key]
+                if first_reason:
+                    reject(smiles, name, f"{first_reason};duplicate_of:{first}")
+                else:
+                    reject(smiles, name, f"duplicate_of:{first}")
+                continue
+
+            reason = check_properties(mol, limits, alerts)
+            seen[key] = (name, reason)
+            if reason:
+                reject(smiles, name, reason)
+                continue
+
+            stats['passed'] += 1
+            passed.append((Chem.MolToSmiles(mol), name, mol))
+        return passed
+
+    try:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield from process_batch(batch)
+                batch = []
+        if batch:
+            yield from process_batch(batch)
+    finally:
+        if rejects:
+            rejects.close()
+        print(f"预过滤: 共 {stats['total']} 个, 通过 {stats['passed']} 个, "
+              f"拒绝 {stats['rejected']} 个")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("用法: python ligand_filter.py <输入.smi> <输出.smi> [拒绝文件] [smiles|inchikey]")
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    output_file = sys.argv[2]
+    rejects_file = sys.argv[3] if len(sys.argv) > 3 else "rejects.smi"
+    dedup_by = sys.argv[4] if len(sys.argv) > 4 else 'smiles'
+
+    with open(output_file, 'w') as out:
+        for smiles, name, mol in filter_ligands(
+                read_smiles_file(input_file), rejects_file, dedup_by=dedup_by):
+            out.write(f"{smiles} {name}\n")
+
+    print(f"[OK] 过滤结果: {output_file}")
+    print(f"[OK] 拒绝列表: {rejects_file}")
@@ -0,0 +1,440 @@
+import math
+import os
+import tempfile
+from get_tool_path import get_tool_path
+from process_runner import run_tool
+
+AMIDE_SMARTS = '[NX3]-[CX3]=[O,S,N]'
+_amide_pattern = None
+
+
+def amide_pattern():
+    """
+    首次使用时编译酰胺SMARTS并缓存
+    """
+    global _amide_pattern
+    if _amide_pattern is None:
+        from rdkit import Chem
+        _amide_pattern = Chem.MolFromSmarts(AMIDE_SMARTS)
+    return _amide_pattern
+
+
+def compute_gasteiger_charges(mol):
+    """
+    计算Gasteiger部分电荷，返回每个原子的电荷列表
+    """
+    from rdkit.Chem import AllChem
+
+    AllChem.ComputeGasteigerCharges(mol)
+    charges = []
+    for atom in mol.GetAtoms():
+        q = atom.GetDoubleProp('_GasteigerCharge')
+        charges.append(0.0 if math.isnan(q) or math.isinf(q) else q)
+    return charges
+
+
+def is_polar_hydrogen(atom):
+    return atom.GetAtomicNum() == 1 and any(
+        n.GetAtomicNum() in (7, 8, 16) for n in atom.GetNeighbors()
+    )
+
+
+def autodock_type(atom, amide_n):
+    """
+    AutoDock原子类型 (C/A, N/NA, OA, SA, HD, H, 卤素等)
+    """
+    symbol = atom.GetSymbol()
+    if symbol == 'C':
+        return 'A' if atom.GetIsAromatic() else 'C'
+    if symbol == 'N':
+        if atom.GetFormalCharge() > 0 or atom.GetIdx() in amide_n:
+            return 'N'
+        if atom.GetTotalNumHs(includeNeighbors=True) > 0 and atom.GetIsAromatic():
+            return 'N'
+        if not atom.GetIsAromatic() and atom.GetTotalDegree() == 3 and any(
+                n.GetIsAromatic() for n in atom.GetNeighbors()):
+            return 'N'
+        return 'NA'
+    if symbol == 'O':
+        return 'OA'
+    if symbol == 'S':
+        return 'SA'
+    if symbol == 'H':
+        return 'HD' if is_polar_hydrogen(atom) else 'H'
+    return symbol
+
+
+# 氮原子类型自检: (SMILES, 按原子序号排列的期望氮类型)
+NITROGEN_TYPE_CHECKS = [
+    ('c1cc[nH]c1', ['N']),
+    ('c1ccc2[nH]ccc2c1CCN', ['N', 'NA']),
+    ('c1ccncc1', ['NA']),
+    ('Nc1ccccc1', ['N']),
+    ('CC(=O)NC', ['N']),
+]
+
+
+def check_atom_types():
+    """
+    对带显式氢的已知分子检查氮原子类型，返回差异列表
+    """
+    from rdkit import Chem
+
+    amide = amide_pattern()
+    issues = []
+    for smiles, expected in NITROGEN_TYPE_CHECKS:
+        mol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+        amide_n = {match[0] for match in mol.GetSubstructMatches(amide)}
+        types = [autodock_type(atom, amide_n) for atom in mol.GetAtoms()
+                 if atom.GetSymbol() == 'N']
+        if types != expected:
+            issues.append(f"{smiles}: 氮原子类型 {types}, 期望 {expected}")
+    return issues
+
+
+def find_rotatable_bonds(mol, kept, amide_bonds):
+    """
+    查找可旋转键：非环单键，两端在保留原子中都不是末端原子，且不是酰胺键或叁键相邻键
+    """
+    from rdkit import Chem
+
+    rotatable = []
+    for bond in mol.GetBonds():
+        if bond.GetBondType() != Chem.BondType.SINGLE or bond.IsInRing():
+            continue
+        a, b = bond.GetBeginAtom(), bond.GetEndAtom()
+        if a.GetIdx() not in kept or b.GetIdx() not in kept:
+            continue
+        if frozenset((a.GetIdx(), b.GetIdx())) in amide_bonds:
+            continue
+        degree_ok = True
+        for atom in (a, b):
+            heavy = [n for n in atom.GetNeighbors() if n.GetIdx() in kept]
+            if len(heavy) < 2:
+                degree_ok = False
+            if any(x.GetBondType() == Chem.BondType.TRIPLE for x in atom.GetBonds()):
+                degree_ok = False
+        if degree_ok:
+            rotatable.append((a.GetIdx(), b.GetIdx()))
+    return rotatable
+
+
+def count_torsdof(mol, rotatable, kept):
+    """
+    TORSDOF不计只转动氢原子的键（如羟基、氨基）
+    """
+    count = 0
+    for a, b in rotatable:
+        only_h = False
+        for x, y in ((a, b), (b, a)):
+            others = [n for n in mol.GetAtomWithIdx(x).GetNeighbors()
+                      if n.GetIdx() != y and n.GetIdx() in kept]
+            if others and all(n.GetAtomicNum() == 1 for n in others):
+                only_h = True
+        if not only_h:
+            count += 1
+    return count
+
+
+def build_fragments(mol, kept, rotatable):
+    """
+    断开可旋转键后得到刚性片段，返回 原子->片段 映射与片段列表
+    """
+    cut = {frozenset(bond) for bond in rotatable}
+    frag_of = {}
+    fragments = []
+    for start in sorted(kept):
+        if start in frag_of:
+            continue
+        frag_id = len(fragments)
+        stack = [start]
+        members = []
+        frag_of[start] = frag_id
+        while stack:
+            idx = stack.pop()
+            members.append(idx)
+            for n in mol.GetAtomWithIdx(idx).GetNeighbors():
+                j = n.GetIdx()
+                if j in kept and j not in frag_of and frozenset((idx, j)) not in cut:
+                    frag_of[j] = frag_id
+                    stack.append(j)
+        fragments.append(sorted(members))
+    return frag_of, fragments
+
+
+def choose_root(fragments, frag_of, rotatable):
+    """
+    选择使扭转树深度最小的片段作为根，相同深度时选原子数多的
+    """
+    adjacency = {i: [] for i in range(len(fragments))}
+    for a, b in rotatable:
+        adjacency[frag_of[a]].append(frag_of[b])
+        adjacency[frag_of[b]].append(frag_of[a])
+
+    best, best_key = 0, None
+    for frag_id in adjacency:
+        depth = {frag_id: 0}
+        queue = [frag_id]
+        while queue:
+            cur = queue.pop(0)
+            for nxt in adjacency[cur]:
+                if nxt not in depth:
+                    depth[nxt] = depth[cur] + 1
+                    queue.append(nxt)
+        key = (max(depth.values()), -len(fragments[frag_id]))
+        if best_key is None or key < best_key:
+            best, best_key = frag_id, key
+    return best
+
+
+def format_atom_line(serial, name, x, y, z, charge, ad_type):
+    atom_name = f" {name:<3s}" if len(name) < 4 else name[:4]
+    return (f"ATOM  {serial:5d} {atom_name:4s} UNL     1    "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}{1.00:6.2f}{0.00:6.2f}    "
+            f"{charge:+6.3f} {ad_type:<2s}")
+
+
+def mol_to_pdbqt_block(mol, conf_id=-1, name=None, charges=None):
+    """
+    将带氢和三维构象的RDKit分子转换为PDBQT文本（单个构象）：
+    - Gasteiger电荷，非极性氢合并到重原子
+    - AutoDock原子类型
+    - 基于可旋转键的ROOT/BRANCH扭转树
+    分子必须是单个连通片段（多片段时先用ligand_filter.strip_salts去盐）
+    """
+    from rdkit import Chem
+
+    if mol.GetNumConformers() == 0:
+        raise Exception("分子没有三维构象")
+    n_frags = len(Chem.GetMolFrags(mol))
+    if n_frags > 1:
+        raise Exception(f"分子包含 {n_frags} 个不相连的片段，请先去盐")
+
+    if charges is None:
+        charges = compute_gasteiger_charges(mol)
+    charges = list(charges)
+
+    kept = set()
+    for atom in mol.GetAtoms():
+        if atom.GetAtomicNum() == 1 and not is_polar_hydrogen(atom):
+            heavy = atom.GetNeighbors()
+            if heavy:
+                charges[heavy[0].GetIdx()] += charges[atom.GetIdx()]
+            continue
+        kept.add(atom.GetIdx())
+
+    amide_n = set()
+    amide_bonds = set()
+    for n_idx, c_idx, _ in mol.GetSubstructMatches(amide_pattern()):
+        amide_n.add(n_idx)
+        amide_bonds.add(frozenset((n_idx, c_idx)))
+
+    rotatable = find_rotatable_bonds(mol, kept, amide_bonds)
+    frag_of, fragments = build_fragments(mol, kept, rotatable)
+    root = choose_root(fragments, frag_of, rotatable)
+    conf = mol.GetConformer(conf_id)
+
+    serial_of = {}
+    body = []
+    element_count = {}
+    branches = []
+
+    def write_atoms(frag_id, first=None):
+        members = fragments[frag_id]
+        if first is not None:
+            members = [first] + [i for i in members if i != first]
+        for idx in members:
+            atom = mol.GetAtomWithIdx(idx)
+            symbol = atom.GetSymbol()
+            element_count[symbol] = element_count.get(symbol, 0) + 1
+            serial = len(serial_of) + 1
+            serial_of[idx] = serial
+            pos = conf.GetAtomPosition(idx)
+            body.append(format_atom_line(
+                serial, f"{symbol}{element_count[symbol]}", pos.x, pos.y, pos.z,
+                charges[idx], autodock_type(atom, amide_n)
+            ))
+
+    def write_branches(frag_id, parent_id):
+        for a, b in rotatable:
+            for x, y in ((a, b), (b, a)):
+                if frag_of[x] == frag_id and frag_of[y] != parent_id \
+                        and frag_of[y] != frag_id:
+                    child = frag_of[y]
+                    start = len(body)
+                    body.append(None)
+                    write_atoms(child, first=y)
+                    body[start] = f"BRANCH {serial_of[x]:3d} {serial_of[y]:3d}"
+                    branches.append((x, y))
+                    write_branches(child, frag_id)
+                    body.append(f"ENDBRANCH {serial_of[x]:3d} {serial_of[y]:3d}")
+
+    body.append("ROOT")
+    write_atoms(root)
+    body.append("ENDROOT")
+    write_branches(root, None)
+
+    torsdof = count_torsdof(mol, rotatable, kept)
+    title = name or (mol.GetProp('_Name') if mol.HasProp('_Name') else "")
+    lines = [
+        f"REMARK  Name = {title}",
+        f"REMARK  {len(branches)} active torsions:",
+    ]
+    lines += body
+    lines.append(f"TORSDOF {torsdof}")
+    return "\n".join(lines) + "\n"
+
+
+def mol_to_pdbqt(mol, conf_ids=None, name=None):
+    """
+    转换一个或多个构象；多个构象时与obabel一样以MODEL/ENDMDL分隔
+    """
+    if conf_ids is None:
+        conf_ids = [mol.GetConformer().GetId()]
+    conf_ids = list(conf_ids)
+    charges = compute_gasteiger_charges(mol)
+
+    if len(conf_ids) == 1:
+        return mol_to_pdbqt_block(mol, conf_ids[0], name, charges)
+
+    blocks = []
+    for i, cid in enumerate(conf_ids, 1):
+        blocks.append(f"MODEL {i:8d}\n")
+        blocks.append(mol_to_pdbqt_block(mol, cid, name, charges))
+        blocks.append("ENDMDL\n")
+    return "".join(blocks)
+
+
+def write_pdbqt(mol, output_file, conf_ids=None, name=None):
+    with open(output_file, 'w') as f:
+        f.write(mol_to_pdbqt(mol, conf_ids, name))
+    return output_file
+
+
+def parse_pdbqt(text):
+    """
+    解析PDBQT文本（仅第一个MODEL），返回原子列表与TORSDOF
+    """
+    atoms = []
+    torsdof = None
+    for line in text.splitlines():
+        if line.startswith("ENDMDL"):
+            break
+        if line.startswith(("ATOM", "HETATM")):
+            atoms.append({
+                'coord': (float(line[30:38]), float(line[38:46]), float(line[46:54])),
+                'charge': float(line[70:76]),
+                'type': line[77:79].strip(),
+            })
+        elif line.startswith("TORSDOF"):
+            torsdof = int(line.split()[1])
+    return atoms, torsdof
+
+
+def compare_pdbqt(ours, reference, charge_tol=0.05, coord_tol=0.01):
+    """
+    比较两个PDBQT文本：原子数、原子类型、TORSDOF和部分电荷
+    返回差异列表，为空时表示一致
+    """
+    atoms_a, torsdof_a = parse_pdbqt(ours)
+    atoms_b, torsdof_b = parse_pdbqt(reference)
+    issues = []
+
+    if len(atoms_a) != len(atoms_b):
+        issues.append(f"原子数不同: {len(atoms_a)} vs {len(atoms_b)}")
+    if torsdof_a != torsdof_b:
+        issues.append(f"TORSDOF不同: {torsdof_a} vs {torsdof_b}")
+
+    for atom in atoms_a:
+        match = None
+        for other in atoms_b:
+            if all(abs(p - q) <= coord_tol for p, q in zip(atom['coord'], other['coord'])):
+                match = other
+                break
+        if match is None:
+            issues.append(f"未匹配的原子: {atom['coord']} {atom['type']}")
+            continue
+        if atom['type'] != match['type']:
+            issues.append(f"原子类型不同 {atom['coord']}: {atom['type']} vs {match['type']}")
+        if abs(atom['charge'] - match['charge']) > charge_tol:
+            issues.append(f"电荷不同 {atom['coord']}: {atom['charge']:+.3f} vs {match['charge']:+.3f}")
+
+    return issues
+
+
+def validate_against_obabel(sdf_file, obabel_path=None, timeout=300):
+    """
+    验证模式：对SDF中的第一个分子分别用本模块和obabel生成PDBQT并比较
+    """
+    from rdkit import Chem
+
+    obabel_path = obabel_path or get_tool_path('obabel')
+    if not obabel_path:
+        raise Exception("未找到OpenBabel路径，请在工具配置中设置")
+
+    supplier = Chem.SDMolSupplier(sdf_file, removeHs=False)
+    mol = next(iter(supplier), None)
+    if mol is None:
+        raise Exception(f"无法读取SDF文件: {sdf_file}")
+
+    ours = mol_to_pdbqt(mol)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single_sdf = os.path.join(tmp, "ligand.sdf")
+        ref_pdbqt = os.path.join(tmp, "ligand.pdbqt")
+        w = Chem.SDWriter(single_sdf)
+        w.write(mol)
+        w.close()
+
+        result = run_tool([obabel_path, single_sdf, "-O", ref_pdbqt,
+                           "--partialcharge", "gasteiger"], timeout=timeout)
+        if not result.ok:
+            raise Exception(f"OpenBabel转换失败: {result.stderr}")
+        with open(ref_pdbqt) as f:
+            reference = f.read()
+
+    return compare_pdbqt(ours, reference)
+
+
+if __name__ == "__main__":
+    import sys
+    from rdkit import Chem
+
+    if len(sys.argv) < 2:
+        print("用法: python pdbqt_writer.py <SDF文件> [输出.pdbqt]")
+        print("      python pdbqt_writer.py --validate <SDF文件>...")
+        print("      python pdbqt_writer.py --check")
+        sys.exit(1)
+
+    if sys.argv[1] in ("--check", "--validate"):
+        type_issues = check_atom_types()
+        for issue in type_issues:
+            print(f"[FAIL] {issue}")
+        if not type_issues:
+            print("[OK] 原子类型自检")
+        if sys.argv[1] == "--check":
+            sys.exit(1 if type_issues else 0)
+
+    if sys.argv[1] == "--validate":
+        failed = 1 if type_issues else 0
+        for sdf_file in sys.argv[2:]:
+            issues = validate_against_obabel(sdf_file)
+            if issues:
+                failed += 1
+                print(f"[FAIL] {sdf_file}")
+                for issue in issues:
+                    print(f"  - {issue}")
+            else:
+                print(f"[OK] {sdf_file}")
+        sys.exit(1 if failed else 0)
+
+    sdf_file = sys.argv[1]
+    output_file = sys.argv[2] if len(sys.argv) > 2 else \
+        os.path.splitext(sdf_file)[0] + ".pdbqt"
+
+    mol = next(iter(Chem.SDMolSupplier(sdf_file, removeHs=False)), None)
+    if mol is None:
+        print(f"[FAIL] {sdf_file}")
+        sys.exit(1)
+    write_pdbqt(mol, output_file)
+    print(f"[OK] {output_file}")
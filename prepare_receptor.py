@@ -1,8 +1,8 @@
 import os
-import subprocess
 import json
-from Bio.PDB import PDBParser
-import numpy as np
+from process_runner import run_tool
+
+OBABEL_TIMEOUT = 600
 
 def get_tool_path(tool_key):
     config_file = 'tool_config.json'
@@ -24,10 +24,12 @@ def pdb_to_pdbqt(pdb_file, output_pdbqt):
         if not obabel_path:
             raise Exception("未找到OpenBabel路径，请在工具配置中设置")
         
-        cmd = f'"{obabel_path}" "{pdb_file}" -O "{output_pdbqt}" -xr'
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        result = run_tool([obabel_path, pdb_file, "-O", output_pdbqt, "-xr"],
+                          timeout=OBABEL_TIMEOUT)
         
-        if result.returncode != 0:
+        if result.timed_out:
+            raise Exception(f"OpenBabel转换超时 ({OBABEL_TIMEOUT}s)")
+        if not result.ok:
             raise Exception(f"OpenBabel转换失败: {result.stderr}")
         
         print(f"[OK] PDB转PDBQT成功: {output_pdbqt}")
@@ -41,6 +43,9 @@ def extract_ligand_from_pdb(pdb_file):
     从PDB文件中提取配体信息
     返回配体的原子坐标
     """
+    from Bio.PDB import PDBParser
+    import numpy as np
+
     parser = PDBParser()
     structure = parser.get_structure("receptor", pdb_file)
     
@@ -60,6 +65,8 @@ def calculate_binding_site_center(ligand_atoms, padding=5.0):
     """
     计算活性位点中心坐标
     """
+    import numpy as np
+
     if ligand_atoms is None or len(ligand_atoms) == 0:
         return None
     
@@ -70,6 +77,8 @@ def calculate_box_size(ligand_atoms, padding=10.0):
     """
     计算对接盒子大小
     """
+    import numpy as np
+
     if ligand_atoms is None or len(ligand_atoms) == 0:
         return [20.0, 20.0, 20.0]
     
@@ -105,11 +114,11 @@ energy_range = {energy_range}
     print(f"[OK] 配置文件生成成功: {output_file}")
     return True
 
-def prepare_receptor(pdb_file, output_dir="."):
+def prepare_receptor(pdb_file, output_dir=".", center=None, size=None):
     """
     准备受体文件：
     1. 将PDB转换为PDBQT
-    2. 提取活性位点
+    2. 提取活性位点（指定center和size时直接使用给定的对接盒子）
     3. 生成vina.conf配置文件
     """
     os.makedirs(output_dir, exist_ok=True)
@@ -128,18 +137,21 @@ def prepare_receptor(pdb_file, output_dir="."):
         raise Exception("PDB转PDBQT失败")
     
     print("步骤2: 提取活性位点...")
-    ligand_atoms = extract_ligand_from_pdb(pdb_file)
-    
-    if ligand_atoms is not None:
-        print(f"找到 {len(ligand_atoms)} 个配体原子")
-        center = calculate_binding_site_center(ligand_atoms)
-        size = calculate_box_size(ligand_atoms)
-        print(f"活性位点中心: {center}")
-        print(f"对接盒子大小: {size}")
+    if center is not None and size is not None:
+        print(f"使用指定的对接盒子: 中心 {center}, 大小 {size}")
     else:
-        print("警告: 未找到配体，使用默认参数")
-        center = [0.0, 0.0, 0.0]
-        size = [20.0, 20.0, 20.0]
+        ligand_atoms = extract_ligand_from_pdb(pdb_file)
+        
+        if ligand_atoms is not None:
+            print(f"找到 {len(ligand_atoms)} 个配体原子")
+            center = calculate_binding_site_center(ligand_atoms)
+            size = calculate_box_size(ligand_atoms)
+            print(f"活性位点中心: {center}")
+            print(f"对接盒子大小: {size}")
+        else:
+            print("警告: 未找到配体，使用默认参数")
+            center = [0.0, 0.0, 0.0]
+            size = [20.0, 20.0, 20.0]
     
     print("步骤3: 生成vina.conf...")
     if not generate_vina_conf(conf_file, pdbqt_file, center, size):
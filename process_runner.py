@@ -0,0 +1,270 @@
+import asyncio
+import os
+import threading
+import time
+
+DEFAULT_TIMEOUT = 3600
+READ_CHUNK = 65536
+KILL_GRACE = 10
+
+
+class ProcessResult:
+    def __init__(self, cmd, returncode, stdout, stderr, elapsed,
+                 timed_out=False, cancelled=False, error=None):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+        self.error = error
+
+    @property
+    def ok(self):
+        return (self.returncode == 0 and not self.timed_out and not self.cancelled
+                and self.error is None)
+
+
+class ProcessRunner:
+    """
+    共享的异步外部工具运行器：
+    - 信号量限制并发进程数
+    - 每个进程独立超时
+    - 按块读取stdout/stderr并逐行回调，不受行长度限制
+    - 超时、取消或处理输出出错时结束子进程
+    """
+    def __init__(self, max_concurrency=None, timeout=DEFAULT_TIMEOUT):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._loop = None
+        self._tasks = set()
+
+    def stop(self):
+        """
+        停止运行（可在其他线程中调用）：取消等待中的任务并结束正在运行的进程
+        """
+        self._stop.set()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._cancel_tasks)
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def _cancel_tasks(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _read_stream(self, stream, lines, on_line, name, errors, failed):
+        """
+        按块读取并自行分行（超长行不会超过StreamReader的限制）；
+        处理输出出错时记录到errors并通知failed，之后继续读空管道，
+        保证进程结束后管道能关闭、proc.wait()能返回
+        """
+        def emit(line):
+            if errors:
+                return
+            try:
+                text = line.decode(errors='replace').rstrip('\r')
+                lines.append(text)
+                if on_line:
+                    on_line(name, text)
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+        buf = bytearray()
+        try:
+            while True:
+                chunk = await stream.read(READ_CHUNK)
+                if not chunk:
+                    break
+                buf += chunk
+                end = buf.rfind(b"\n")
+                if end < 0:
+                    continue
+                complete = bytes(buf[:end])
+                del buf[:end + 1]
+                for line in complete.split(b"\n"):
+                    emit(line)
+            if buf:
+                emit(bytes(buf))
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+
+    async def _kill(self, proc, finished):
+        """
+        结束进程并等待输出读取完成，最多等待KILL_GRACE秒
+        （子进程的后代仍占用管道时不再等待）
+        """
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        done, _ = await asyncio.wait({finished}, timeout=KILL_GRACE)
+        if not done:
+            finished.cancel()
+        try:
+            await finished
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def run(self, cmd, timeout=None, cwd=None, on_line=None, semaphore=None):
+        """
+        运行单个命令（参数列表，不经过shell），返回ProcessResult
+        """
+        timeout = self.timeout if timeout is None else timeout
+        semaphore = semaphore or asyncio.Semaphore(1)
+
+        async with semaphore:
+            start = time.time()
+            if self.stopped:
+                return ProcessResult(cmd, None, "", "", 0.0, cancelled=True)
+
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *[str(c) for c in cmd],
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd
+                )
+            except OSError as e:
+                return ProcessResult(cmd, None, "", str(e), time.time() - start)
+
+            stdout, stderr, errors = [], [], []
+            failed = asyncio.Event()
+            finished = asyncio.ensure_future(asyncio.gather(
+                proc.wait(),
+                self._read_stream(proc.stdout, stdout, on_line, 'stdout', errors, failed),
+                self._read_stream(proc.stderr, stderr, on_line, 'stderr', errors, failed)
+            ))
+            failure = asyncio.ensure_future(failed.wait())
+            timed_out = False
+            cancelled = False
+            try:
+                done, _ = await asyncio.wait({finished, failure}, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                timed_out = not done
+            except asyncio.CancelledError:
+                cancelled = True
+            finally:
+                failure.cancel()
+                if timed_out or cancelled or errors:
+                    await self._kill(proc, finished)
+
+            error = None
+            if errors:
+                error = f"读取输出失败: {errors[0]}"
+                stderr.append(error)
+            return ProcessResult(
+                cmd, proc.returncode, "\n".join(stdout), "\n".join(stderr),
+                time.time() - start, timed_out=timed_out, cancelled=cancelled, error=error
+            )
+
+    async def run_all(self, cmds, timeout=None, cwd=None, on_line=None, on_done=None):
+        """
+        并发运行多个命令（并发数受max_concurrency限制），结果与cmds顺序一致。
+        cmds中的元素可以是命令列表，也可以是 (key, 命令列表)；
+        on_done(key, result) 在每个进程结束时回调；
+        回调抛出的异常会取消其余任务并向调用者抛出，只有进程本身的失败转换为结果
+        """
+        self._loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(item):
+            key, cmd = item if isinstance(item, tuple) else (None, item)
+            result = await self.run(cmd, timeout=timeout, cwd=cwd,
+                                    on_line=on_line, semaphore=semaphore)
+            if on_done:
+                try:
+                    on_done(key, result)
+                except Exception as e:
+                    callback_errors.append(e)
+                    for task in tasks:
+                        task.cancel()
+            return result
+
+        callback_errors = []
+        tasks = [asyncio.ensure_future(run_one(item)) for item in cmds]
+        self._tasks.update(tasks)
+        if self.stopped:
+            self._cancel_tasks()
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._tasks.difference_update(tasks)
+
+        if callback_errors:
+            raise callback_errors[0]
+
+        return [
+            r if isinstance(r, ProcessResult)
+            else ProcessResult(item[1] if isinstance(item, tuple) else item,
+                               None, "", str(r), 0.0,
+                               cancelled=isinstance(r, asyncio.CancelledError))
+            for item, r in zip(cmds, results)
+        ]
+
+    async def run_pull(self, next_job, timeout=None, cwd=None, on_line=None, on_done=None):
+        """
+        动态调度：max_concurrency个工作协程循环调用 next_job() 取任务，
+        返回 (key, 命令列表)，返回None时该工作协程结束；
+        任务在进程启动时才确定，调用方可以根据已完成任务调整后续顺序。
+        on_done(key, result) 抛出的异常会停止其余工作协程并向调用者抛出
+        """
+        self._loop = asyncio.get_running_loop()
+
+        failed = []
+
+        async def worker():
+            try:
+                while not self.stopped and not failed:
+                    job = next_job()
+                    if job is None:
+                        return
+                    key, cmd = job
+                    result = await self.run(cmd, timeout=timeout, cwd=cwd, on_line=on_line)
+                    if failed:
+                        return
+                    if on_done:
+                        on_done(key, result)
+            except Exception as e:
+                failed.append(e)
+                for task in workers:
+                    if task is not asyncio.current_task():
+                        task.cancel()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        self._tasks.update(workers)
+        if self.stopped:
+            self._cancel_tasks()
+        try:
+            await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            self._tasks.difference_update(workers)
+
+        if failed:
+            raise failed[0]
+
+    def run_pull_sync(self, next_job, timeout=None, cwd=None, on_line=None, on_done=None):
+        return asyncio.run(self.run_pull(next_job, timeout=timeout, cwd=cwd,
+                                         on_line=on_line, on_done=on_done))
+
+    def run_sync(self, cmd, timeout=None, cwd=None, on_line=None):
+        return self.run_all_sync([cmd], timeout=timeout, cwd=cwd, on_line=on_line)[0]
+
+    def run_all_sync(self, cmds, timeout=None, cwd=None, on_line=None, on_done=None):
+        return asyncio.run(self.run_all(cmds, timeout=timeout, cwd=cwd,
+                                        on_line=on_line, on_done=on_done))
+
+
+def run_tool(cmd, timeout=DEFAULT_TIMEOUT, cwd=None, on_line=None):
+    """
+    同步运行单个外部工具
+    """
+    return ProcessRunner(1, timeout).run_sync(cmd, cwd=cwd, on_line=on_line)
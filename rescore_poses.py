@@ -0,0 +1,155 @@
+import csv
+import os
+import re
+import tempfile
+from get_tool_path import get_tool_path
+from process_runner import ProcessRunner
+from run_vina import parse_best_affinity_text
+from shard_archive import ShardWriter, list_inputs, STAGE_CHUNK
+
+RESCORE_TIMEOUT = 600
+RESCORE_MODES = ('score_only', 'local_only')
+
+AFFINITY_PATTERNS = [
+    re.compile(r"Estimated Free Energy of Binding\s*:\s*(-?\d+\.?\d*)"),
+    re.compile(r"Affinity:\s*(-?\d+\.?\d*)"),
+]
+
+
+def extract_best_pose(out_text):
+    """
+    取vina输出中的第一个（最佳）构象，去掉MODEL/ENDMDL
+    """
+    lines = []
+    in_model = False
+    for line in out_text.splitlines():
+        if line.startswith("MODEL"):
+            if in_model or lines:
+                break
+            in_model = True
+            continue
+        if line.startswith("ENDMDL"):
+            break
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def parse_rescore_affinity(stdout):
+    for pattern in AFFINITY_PATTERNS:
+        match = pattern.search(stdout)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def rescore_poses(results_dir="docking_results", conf_file="vina.conf", tag="rescore",
+                  mode='score_only', concurrency=None, timeout=RESCORE_TIMEOUT, runner=None):
+    """
+    使用新的受体配置对已有对接构象重新打分，不重新搜索：
+    - score_only: 仅对最佳构象打分
+    - local_only: 在原构象附近做局部优化后打分
+    结果保存在原结果旁：<名称>.<tag>.log（local_only还有<名称>.<tag>.pdbqt），
+    results_dir 为分片归档时写入 results_dir/<tag>-*.shard；
+    汇总写入 results_dir/<tag>.csv（原结合能、新结合能、差值）
+    返回汇总行列表
+    """
+    if mode not in RESCORE_MODES:
+        raise Exception(f"不支持的重打分模式: {mode}")
+
+    vina_path = get_tool_path('vina')
+    if not vina_path:
+        raise Exception("未找到AutoDock Vina路径，请在步骤1中配置工具路径")
+
+    runner = runner or ProcessRunner(concurrency, timeout)
+    items, reader = list_inputs(results_dir, "_out.pdbqt")
+    shards = ShardWriter(results_dir, tag) if reader else None
+    rows = []
+
+    def save(filename, text):
+        if shards:
+            shards.write(filename, text)
+        else:
+            with open(os.path.join(results_dir, filename), 'w') as f:
+                f.write(text)
+
+    def read_input(source):
+        if reader:
+            return reader.read(source)
+        with open(source) as f:
+            return f.read()
+
+    try:
+        for i in range(0, len(items), STAGE_CHUNK):
+            if runner.stopped:
+                break
+            with tempfile.TemporaryDirectory() as tmp:
+                jobs = []
+                original = {}
+                for stem, source in items[i:i + STAGE_CHUNK]:
+                    name = stem[:-len("_out")] if stem.endswith("_out") else stem
+                    out_text = read_input(source)
+                    original[name] = parse_best_affinity_text(out_text)
+                    pose_file = os.path.join(tmp, f"{name}.pdbqt")
+                    with open(pose_file, 'w') as f:
+                        f.write(extract_best_pose(out_text))
+
+                    cmd = [vina_path, "--config", conf_file, "--ligand", pose_file,
+                           f"--{mode}", "--cpu", "1"]
+                    if mode == 'local_only':
+                        cmd += ["--out", os.path.join(tmp, f"{name}.{tag}.pdbqt")]
+                    jobs.append((name, cmd))
+
+                def on_done(name, result):
+                    if result.cancelled:
+                        return
+                    affinity = parse_rescore_affinity(result.stdout) if result.ok else None
+                    if result.ok:
+                        save(f"{name}.{tag}.log", result.stdout)
+                        pose_out = os.path.join(tmp, f"{name}.{tag}.pdbqt")
+                        if os.path.exists(pose_out):
+                            with open(pose_out) as f:
+                                save(f"{name}.{tag}.pdbqt", f.read())
+                        print(f"[OK] {name} {original[name]} -> {affinity} kcal/mol")
+                    else:
+                        reason = "超时" if result.timed_out else result.stderr.strip()
+                        print(f"[FAIL] {name}: {reason}")
+                    delta = None
+                    if affinity is not None and original[name] is not None:
+                        delta = round(affinity - original[name], 3)
+                    rows.append({'ligand': name, 'original': original[name],
+                                 'rescored': affinity, 'delta': delta})
+
+                runner.run_all_sync(jobs, on_done=on_done)
+    finally:
+        if shards:
+            shards.close()
+
+    rows.sort(key=lambda r: (r['rescored'] is None, r['rescored'] or 0.0))
+    summary = os.path.join(results_dir, f"{tag}.csv")
+    with open(summary, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['ligand', 'original', 'rescored', 'delta'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"[OK] 重打分汇总: {summary}")
+
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python rescore_poses.py <新受体vina.conf> [结果目录] [标签] [score_only|local_only]")
+        sys.exit(1)
+
+    conf_file = sys.argv[1]
+    results_dir = sys.argv[2] if len(sys.argv) > 2 else "docking_results"
+    tag = sys.argv[3] if len(sys.argv) > 3 else "rescore"
+    mode = sys.argv[4] if len(sys.argv) > 4 else 'score_only'
+
+    try:
+        rows = rescore_poses(results_dir, conf_file, tag, mode)
+        print(f"\n重打分完成: {len(rows)} 个配体")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        sys.exit(1)
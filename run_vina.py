@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+from get_tool_path import get_tool_path
+from process_runner import ProcessRunner
+from shard_archive import ShardWriter, list_inputs, iter_inputs, STAGE_CHUNK
+from job_cost import CostModel, LongestFirstQueue, pdbqt_features
+
+VINA_TIMEOUT = 3600
+
+
+def build_vina_command(vina_path, conf_file, ligand_file, out_dir, cpu=None, name=None):
+    name = name or os.path.splitext(os.path.basename(ligand_file))[0]
+    cmd = [
+        vina_path,
+        "--config", conf_file,
+        "--ligand", ligand_file,
+        "--out", os.path.join(out_dir, f"{name}_out.pdbqt"),
+        "--log", os.path.join(out_dir, f"{name}.log"),
+    ]
+    if cpu:
+        cmd += ["--cpu", str(cpu)]
+    return name, cmd
+
+
+def parse_best_affinity_text(text):
+    """
+    从vina输出的PDBQT文本中读取最佳结合能 (kcal/mol)，第一个 REMARK VINA RESULT
+    """
+    for line in text.splitlines():
+        if line.startswith("REMARK VINA RESULT:"):
+            try:
+                return float(line.split()[3])
+            except (ValueError, IndexError):
+                return None
+    return None
+
+
+def parse_best_affinity(out_file):
+    try:
+        with open(out_file) as f:
+            return parse_best_affinity_text(f.read())
+    except OSError:
+        return None
+
+
+def run_vina(ligand_dir="pdbqt", out_dir="docking_results", conf_file="vina.conf",
+             concurrency=None, cpu=None, timeout=VINA_TIMEOUT, runner=None,
+             on_result=None, shard_output=False, order_by_cost=True):
+    """
+    使用AutoDock Vina对ligand_dir下的所有配体并发对接
+    ligand_dir 可以是普通目录或分片归档；shard_output 时 <名称>_out.pdbqt 和
+    <名称>.log 写入 out_dir/results-*.shard
+    concurrency: 同时运行的vina进程数；cpu: 每个vina进程使用的CPU数
+    on_result(名称, 最佳结合能, ProcessResult): 每个配体完成时回调，
+    失败时结合能为None；可在回调中调用runner.stop()提前结束
+    order_by_cost: 按TORSDOF和原子数估计耗时，空闲进程总是取当前估计耗时最长的配体；
+    耗时模型在运行中根据实测时间更新并重排后续配体，结束时保存到cost_model.json
+    返回 (成功数, 失败数)
+    """
+    vina_path = get_tool_path('vina')
+    if not vina_path:
+        raise Exception("未找到AutoDock Vina路径，请在步骤1中配置工具路径")
+
+    os.makedirs(out_dir, exist_ok=True)
+    runner = runner or ProcessRunner(concurrency, timeout)
+    if cpu is None:
+        cpu = max(1, (os.cpu_count() or 1) // runner.max_concurrency)
+
+    items, reader = list_inputs(ligand_dir, ".pdbqt")
+    model = CostModel('vina') if order_by_cost else None
+    stage_dir = tempfile.mkdtemp() if reader else None
+    queue = LongestFirstQueue(iter_inputs(items, reader, stage_dir), model, pdbqt_features,
+                              window=STAGE_CHUNK if reader else None)
+    shards = ShardWriter(out_dir, "results") if shard_output else None
+    work_dir = tempfile.mkdtemp() if shard_output else out_dir
+    counts = {'ok': 0, 'fail': 0}
+
+    def next_job():
+        job = queue.pop()
+        if job is None:
+            return None
+        _, name, lig = job
+        return build_vina_command(vina_path, conf_file, lig, work_dir, cpu, name)
+
+    def on_done(name, result):
+        out_file = os.path.join(work_dir, f"{name}_out.pdbqt")
+        log_file = os.path.join(work_dir, f"{name}.log")
+        affinity = None
+        ok = result.ok and os.path.exists(out_file)
+        if ok:
+            counts['ok'] += 1
+            with open(out_file) as f:
+                out_text = f.read()
+            affinity = parse_best_affinity_text(out_text)
+            if shards:
+                shards.write(f"{name}_out.pdbqt", out_text)
+                if os.path.exists(log_file):
+                    with open(log_file) as f:
+                        shards.write(f"{name}.log", f.read())
+            print(f"[OK] {name} {affinity} kcal/mol ({result.elapsed:.1f}s)")
+        elif not result.cancelled:
+            counts['fail'] += 1
+            if result.ok:
+                reason = "未生成输出文件"
+            else:
+                reason = "超时" if result.timed_out else result.stderr.strip()
+            print(f"[FAIL] {name}: {reason}")
+        staged = queue.finish(name, result.elapsed if ok else None)
+        if stage_dir and staged:
+            os.remove(staged)
+        if shards:
+            for path in (out_file, log_file):
+                if os.path.exists(path):
+                    os.remove(path)
+        if on_result and not result.cancelled:
+            on_result(name, affinity, result)
+
+    try:
+        runner.run_pull_sync(next_job, on_done=on_done)
+    finally:
+        if shards:
+            shards.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if stage_dir:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        if model and model.samples:
+            model.save()
+
+    return counts['ok'], counts['fail']
+
+
+if __name__ == "__main__":
+    import sys
+
+    ligand_dir = sys.argv[1] if len(sys.argv) > 1 else "pdbqt"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "docking_results"
+    conf_file = sys.argv[3] if len(sys.argv) > 3 else "vina.conf"
+    shard_output = "--shard" in sys.argv[4:]
+
+    ok, fail = run_vina(ligand_dir, out_dir, conf_file, shard_output=shard_output)
+    print(f"\n对接完成: 成功 {ok} 个, 失败 {fail} 个")
+    if fail and not ok:
+        sys.exit(1)
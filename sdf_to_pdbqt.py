@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from get_tool_path import get_tool_path
+from process_runner import ProcessRunner
+from shard_archive import ShardWriter, list_inputs, iter_inputs, STAGE_CHUNK
+from job_cost import CostModel, LongestFirstQueue, sdf_features
+
+OBABEL_TIMEOUT = 300
+
+
+def convert_sdf_dir(sdf_dir="sdf", out_dir="pdbqt", concurrency=None,
+                    timeout=OBABEL_TIMEOUT, runner=None, shard_output=False,
+                    order_by_cost=True):
+    """
+    使用OpenBabel将sdf_dir下的SDF文件并发转换为PDBQT格式
+    sdf_dir 可以是普通目录或分片归档；shard_output 时结果写入 out_dir/pdbqt-*.shard
+    order_by_cost: 按构象数和原子数估计耗时，空闲进程总是取当前估计耗时最长的文件；
+    耗时模型在运行中根据实测时间更新并重排后续文件
+    返回 (成功数, 失败数)
+    """
+    obabel_path = get_tool_path('obabel')
+    if not obabel_path:
+        raise Exception("未找到OpenBabel路径，请在工具配置中设置")
+
+    os.makedirs(out_dir, exist_ok=True)
+    runner = runner or ProcessRunner(concurrency, timeout)
+    items, reader = list_inputs(sdf_dir, ".sdf")
+    model = CostModel('obabel') if order_by_cost else None
+    stage_dir = tempfile.mkdtemp() if reader else None
+    queue = LongestFirstQueue(iter_inputs(items, reader, stage_dir), model, sdf_features,
+                              window=STAGE_CHUNK if reader else None)
+    shards = ShardWriter(out_dir, "pdbqt") if shard_output else None
+    work_dir = tempfile.mkdtemp() if shard_output else out_dir
+    counts = {'ok': 0, 'fail': 0}
+
+    def next_job():
+        job = queue.pop()
+        if job is None:
+            return None
+        _, name, sdf_file = job
+        return name, [obabel_path, sdf_file, "-O", os.path.join(work_dir, f"{name}.pdbqt"),
+                      "--partialcharge", "gasteiger"]
+
+    def on_done(name, result):
+        out = os.path.join(work_dir, f"{name}.pdbqt")
+        ok = result.ok and os.path.exists(out)
+        if ok:
+            counts['ok'] += 1
+            if shards:
+                with open(out) as f:
+                    shards.write(f"{name}.pdbqt", f.read())
+            print(f"[OK] {name}")
+        else:
+            counts['fail'] += 1
+            if result.ok:
+                reason = "未生成输出文件"
+            else:
+                reason = "超时" if result.timed_out else result.stderr.strip()
+            print(f"[FAIL] {name}: {reason}")
+        staged = queue.finish(name, result.elapsed if ok else None)
+        if stage_dir and staged:
+            os.remove(staged)
+        if shards and os.path.exists(out):
+            os.remove(out)
+
+    try:
+        runner.run_pull_sync(next_job, on_done=on_done)
+    finally:
+        if shards:
+            shards.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if stage_dir:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        if model and model.samples:
+            model.save()
+
+    return counts['ok'], counts['fail']
+
+
+if __name__ == "__main__":
+    import sys
+
+    sdf_dir = sys.argv[1] if len(sys.argv) > 1 else "sdf"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "pdbqt"
+    shard_output = "--shard" in sys.argv[3:]
+
+    ok, fail = convert_sdf_dir(sdf_dir, out_dir, shard_output=shard_output)
+    print(f"\n转换完成: 成功 {ok} 个, 失败 {fail} 个")
+    if fail and not ok:
+        sys.exit(1)
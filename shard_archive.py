@@ -0,0 +1,268 @@
+import glob
+import gzip
+import json
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RECORDS_PER_SHARD = 10000
+STAGE_CHUNK = 1000
+SHARD_SUFFIX = ".shard"
+INDEX_SUFFIX = ".shard.idx"
+
+
+def compress(data, codec):
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise Exception("zstd压缩需要安装 zstandard: pip install zstandard")
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    raise Exception(f"不支持的压缩格式: {codec}")
+
+
+def decompress(data, codec):
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise Exception("zstd压缩需要安装 zstandard: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise Exception(f"不支持的压缩格式: {codec}")
+
+
+def is_shard_path(path):
+    """
+    判断路径是否为分片归档（单个.shard文件，或包含.shard.idx的目录）
+    """
+    if os.path.isfile(path):
+        return path.endswith(SHARD_SUFFIX) and os.path.exists(path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX)
+    return bool(glob.glob(os.path.join(path, "*" + INDEX_SUFFIX)))
+
+
+def record_stem(key):
+    return os.path.splitext(key)[0]
+
+
+class ShardWriter:
+    """
+    将大量小文件写成压缩分片：
+    每条记录单独压缩后追加到 <prefix>-NNNNN.shard，
+    偏移索引逐条追加到 <prefix>-NNNNN.shard.idx（JSON行：首行为压缩格式，
+    之后每行为 [记录名, 偏移, 长度]），数据先于索引落盘，
+    运行中断时已写入的记录仍可读取；每个分片最多 records_per_shard 条记录
+    """
+    def __init__(self, out_dir, prefix, records_per_shard=RECORDS_PER_SHARD, codec='gzip'):
+        if codec == 'zstd' and zstandard is None:
+            raise Exception("zstd压缩需要安装 zstandard: pip install zstandard")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.records_per_shard = records_per_shard
+        self.codec = codec
+        existing = glob.glob(os.path.join(out_dir, f"{prefix}-*{INDEX_SUFFIX}"))
+        numbers = [int(os.path.basename(p)[len(prefix) + 1:-len(INDEX_SUFFIX)])
+                   for p in existing
+                   if os.path.basename(p)[len(prefix) + 1:-len(INDEX_SUFFIX)].isdigit()]
+        self.shard_no = max(numbers) + 1 if numbers else 0
+        self._file = None
+        self._index_file = None
+        self._records = 0
+
+    def _open_shard(self):
+        path = os.path.join(self.out_dir, f"{self.prefix}-{self.shard_no:05d}{SHARD_SUFFIX}")
+        self._file = open(path, 'wb')
+        self._index_file = open(path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX, 'w')
+        self._index_file.write(json.dumps({'codec': self.codec}) + "\n")
+        self._index_file.flush()
+        self._records = 0
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._index_file.close()
+        self._file = None
+        self._index_file = None
+        self.shard_no += 1
+
+    def write(self, key, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._file is None:
+            self._open_shard()
+        payload = compress(data, self.codec)
+        offset = self._file.tell()
+        self._file.write(payload)
+        self._file.flush()
+        self._index_file.write(json.dumps([key, offset, len(payload)]) + "\n")
+        self._index_file.flush()
+        self._records += 1
+        if self._records >= self.records_per_shard:
+            self._close_shard()
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    按记录名随机读取分片归档；path 可以是目录或单个.shard文件。
+    同名记录出现在多个分片中时，编号靠后的分片优先
+    """
+    def __init__(self, path):
+        if os.path.isfile(path):
+            index_files = [path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX]
+        else:
+            index_files = sorted(glob.glob(os.path.join(path, "*" + INDEX_SUFFIX)))
+
+        self.index = {}
+        for index_file in index_files:
+            shard_path = index_file[:-len(INDEX_SUFFIX)] + SHARD_SUFFIX
+            self._load_index(index_file, shard_path)
+
+    def _load_index(self, index_file, shard_path):
+        """
+        读取逐行索引；忽略中断时写了一半的末行以及超出数据文件的记录
+        """
+        size = os.path.getsize(shard_path) if os.path.exists(shard_path) else 0
+        with open(index_file) as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return
+        codec = json.loads(lines[0])['codec']
+        for line in lines[1:]:
+            try:
+                key, offset, length = json.loads(line)
+            except ValueError:
+                continue
+            if offset + length <= size:
+                self.index[key] = (shard_path, offset, length, codec)
+
+    def names(self, suffix=None):
+        return sorted(k for k in self.index if suffix is None or k.endswith(suffix))
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_bytes(self, key):
+        shard_path, offset, length, codec = self.index[key]
+        with open(shard_path, 'rb') as f:
+            f.seek(offset)
+            return decompress(f.read(length), codec)
+
+    def read(self, key):
+        return self.read_bytes(key).decode()
+
+    def extract(self, key, output_file):
+        with open(output_file, 'wb') as f:
+            f.write(self.read_bytes(key))
+        return output_file
+
+    def __iter__(self):
+        """
+        按分片和偏移顺序流式读取所有记录，返回 (记录名, 文本)
+        """
+        entries = sorted(self.index.items(), key=lambda item: (item[1][0], item[1][1]))
+        current, handle = None, None
+        try:
+            for key, (shard_path, offset, length, codec) in entries:
+                if shard_path != current:
+                    if handle:
+                        handle.close()
+                    handle = open(shard_path, 'rb')
+                    current = shard_path
+                handle.seek(offset)
+                yield key, decompress(handle.read(length), codec).decode()
+        finally:
+            if handle:
+                handle.close()
+
+
+def list_inputs(path, suffix):
+    """
+    列出某一阶段的输入，支持普通目录和分片归档
+    返回 ([(名称, 文件路径或记录名)], ShardReader 或 None)
+    """
+    if is_shard_path(path):
+        reader = ShardReader(path)
+        return [(record_stem(key), key) for key in reader.names(suffix)], reader
+    files = sorted(glob.glob(os.path.join(path, "*" + suffix)))
+    return [(record_stem(os.path.basename(f)), f) for f in files], None
+
+
+def iter_inputs(items, reader, tmp_dir):
+    """
+    逐个为外部工具准备输入文件，产出 (名称, 本地文件, 文本)：
+    普通目录直接使用原文件；分片归档时每条记录只解压一次，写入tmp_dir，
+    同时返回文本供计算耗时特征，文件用完后由调用方删除
+    """
+    for name, source in items:
+        if reader is None:
+            try:
+                with open(source) as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                text = ""
+            yield name, source, text
+        else:
+            data = reader.read_bytes(source)
+            local_file = os.path.join(tmp_dir, source)
+            with open(local_file, 'wb') as f:
+                f.write(data)
+            yield name, local_file, data.decode(errors='replace')
+
+
+def pack_dir(src_dir, out_dir, prefix, pattern="*", records_per_shard=RECORDS_PER_SHARD, codec='gzip'):
+    """
+    将已有目录中的小文件打包为分片
+    """
+    count = 0
+    with ShardWriter(out_dir, prefix, records_per_shard, codec) as writer:
+        for path in sorted(glob.glob(os.path.join(src_dir, pattern))):
+            with open(path, 'rb') as f:
+                writer.write(os.path.basename(path), f.read())
+            count += 1
+    return count
+
+
+def unpack(path, out_dir, suffix=None):
+    """
+    将分片中的记录解包为单独文件
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    reader = ShardReader(path)
+    for key in reader.names(suffix):
+        reader.extract(key, os.path.join(out_dir, key))
+    return len(reader.names(suffix))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 4 or sys.argv[1] not in ("pack", "unpack"):
+        print("用法: python shard_archive.py pack <源目录> <分片目录> [前缀] [gzip|zstd]")
+        print("      python shard_archive.py unpack <分片目录或文件> <输出目录>")
+        sys.exit(1)
+
+    if sys.argv[1] == "pack":
+        src_dir, out_dir = sys.argv[2], sys.argv[3]
+        prefix = sys.argv[4] if len(sys.argv) > 4 else os.path.basename(os.path.normpath(src_dir))
+        codec = sys.argv[5] if len(sys.argv) > 5 else 'gzip'
+        n = pack_dir(src_dir, out_dir, prefix, codec=codec)
+        print(f"[OK] 打包 {n} 个文件到 {out_dir}")
+    else:
+        n = unpack(sys.argv[2], sys.argv[3])
+        print(f"[OK] 解包 {n} 个文件到 {sys.argv[3]}")
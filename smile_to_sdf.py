@@ -1,43 +1,151 @@
-from rdkit import Chem
-from rdkit.Chem import AllChem
+import io
 import os
+from ligand_filter import read_smiles_file, filter_ligands
+from shard_archive import ShardWriter, RECORDS_PER_SHARD
 
 INPUT = "ligands.smi"
 OUTDIR = "sdf"
 N_CONFS = 10
 
-os.makedirs(OUTDIR, exist_ok=True)
+REJECTS = "rejects.smi"
+DEDUP_BY = "smiles"  # smiles 或 inchikey
 
-with open(INPUT) as f:
-    for line in f:
-        if not line.strip():
-            continue
 
-        parts = line.strip().split()
-        smiles = parts[0]
-        name = parts[1] if len(parts) > 1 else smiles.replace("/", "_")
+def iter_ligands(input_file, prefilter=True, rejects_file=REJECTS,
+                 dedup_by=DEDUP_BY, filter_limits=None):
+    """
+    产出 (SMILES, 名称, 分子)；不预过滤时无法解析的SMILES产出的分子为None，由调用方计为失败
+    """
+    from rdkit import Chem
 
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            print(f"[FAIL] {name}")
-            continue
+    if prefilter:
+        yield from filter_ligands(
+            read_smiles_file(input_file), rejects_file,
+            limits=filter_limits, dedup_by=dedup_by
+        )
+        return
 
-        mol = Chem.AddHs(mol)
+    for smiles, name in read_smiles_file(input_file):
+        yield smiles, name, Chem.MolFromSmiles(smiles)
 
-        params = AllChem.ETKDGv3()
-        params.randomSeed = 42
 
-        ids = AllChem.EmbedMultipleConfs(
-            mol, numConfs=N_CONFS, params=params
-        )
+def save_record(shards, out_dir, filename, text):
+    if shards:
+        shards.write(filename, text)
+    else:
+        with open(os.path.join(out_dir, filename), 'w') as f:
+            f.write(text)
+
+
+def smiles_to_sdf(input_file=INPUT, out_dir=OUTDIR, n_confs=N_CONFS,
+                  prefilter=True, rejects_file=REJECTS, dedup_by=DEDUP_BY,
+                  filter_limits=None, write_sdf=True, pdbqt_dir=None,
+                  shard_output=False, records_per_shard=RECORDS_PER_SHARD, codec='gzip'):
+    """
+    将SMILES文件中的配体生成三维构象：
+    - prefilter: 构象生成前预过滤和去重（filter_limits覆盖ligand_filter.DEFAULT_LIMITS）
+    - write_sdf: 是否写出 out_dir/<名称>.sdf
+    - pdbqt_dir: 设置时直接在进程内写出PDBQT（最低能量构象），跳过obabel
+    - shard_output: 写成压缩分片 (out_dir/sdf-*.shard, pdbqt_dir/pdbqt-*.shard)，
+      而不是每个配体一个文件
+    返回 (成功数, 失败数)
+    """
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+    from pdbqt_writer import mol_to_pdbqt
+
+    if not write_sdf and not pdbqt_dir:
+        raise Exception("不写出SDF时必须设置pdbqt_dir，否则没有任何输出")
+
+    sdf_shards = pdbqt_shards = None
+    if write_sdf:
+        os.makedirs(out_dir, exist_ok=True)
+        if shard_output:
+            sdf_shards = ShardWriter(out_dir, "sdf", records_per_shard, codec)
+    if pdbqt_dir:
+        os.makedirs(pdbqt_dir, exist_ok=True)
+        if shard_output:
+            pdbqt_shards = ShardWriter(pdbqt_dir, "pdbqt", records_per_shard, codec)
+
+    ok, fail = 0, 0
+    try:
+        for smiles, name, mol in iter_ligands(input_file, prefilter, rejects_file,
+                                              dedup_by, filter_limits):
+            if mol is None:
+                fail += 1
+                print(f"[FAIL] {name}: 无法解析SMILES")
+                continue
+
+            mol = Chem.AddHs(mol)
+
+            params = AllChem.ETKDGv3()
+            params.randomSeed = 42
+
+            ids = AllChem.EmbedMultipleConfs(
+                mol, numConfs=n_confs, params=params
+            )
+
+            energies = {}
+            for cid in ids:
+                ff = AllChem.UFFGetMoleculeForceField(mol, confId=cid)
+                ff.Minimize()
+                energies[cid] = ff.CalcEnergy()
+
+            if not energies:
+                fail += 1
+                print(f"[FAIL] {name}")
+                continue
+
+            pdbqt_text = None
+            if pdbqt_dir:
+                best = min(energies, key=energies.get)
+                try:
+                    pdbqt_text = mol_to_pdbqt(mol, conf_ids=[best], name=name)
+                except Exception as e:
+                    fail += 1
+                    print(f"[FAIL] {name}: {str(e)}")
+                    continue
+
+            if write_sdf:
+                buf = io.StringIO()
+                w = Chem.SDWriter(buf)
+                for cid in ids:
+                    w.write(mol, confId=cid)
+                w.close()
+                save_record(sdf_shards, out_dir, f"{name}.sdf", buf.getvalue())
+
+            if pdbqt_text:
+                save_record(pdbqt_shards, pdbqt_dir, f"{name}.pdbqt", pdbqt_text)
+
+            ok += 1
+            print(f"[OK] {name}")
+    finally:
+        for shards in (sdf_shards, pdbqt_shards):
+            if shards:
+                shards.close()
+
+    return ok, fail
+
+
+if __name__ == "__main__":
+    import sys
 
-        for cid in ids:
-            AllChem.UFFOptimizeMolecule(mol, confId=cid)
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print("用法: python smile_to_sdf.py [SMILES文件] [SDF目录] [构象数] [PDBQT目录|-] [--shard] [--no-sdf]")
+        print("      --no-sdf: 不写出SDF，只在进程内直接生成PDBQT（需指定PDBQT目录）")
+        sys.exit(0)
 
-        out = os.path.join(OUTDIR, f"{name}.sdf")
-        w = Chem.SDWriter(out)
-        for cid in ids:
-            w.write(mol, confId=cid)
-        w.close()
+    input_file = sys.argv[1] if len(sys.argv) > 1 else INPUT
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else OUTDIR
+    n_confs = int(sys.argv[3]) if len(sys.argv) > 3 else N_CONFS
+    pdbqt_dir = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] != "-" else None
+    shard_output = "--shard" in sys.argv[5:]
+    write_sdf = "--no-sdf" not in sys.argv[5:]
 
-        print(f"[OK] {name}")
+    try:
+        ok, fail = smiles_to_sdf(input_file, out_dir, n_confs, write_sdf=write_sdf,
+                                 pdbqt_dir=pdbqt_dir, shard_output=shard_output)
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        sys.exit(1)
+    print(f"\n转换完成: 成功 {ok} 个, 失败 {fail} 个")
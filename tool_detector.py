@@ -1,7 +1,7 @@
 import os
-import subprocess
 import json
 from pathlib import Path
+from process_runner import run_tool
 
 class ToolDetector:
     def __init__(self):
@@ -37,13 +37,8 @@ class ToolDetector:
     
     def find_in_path(self, executable):
         try:
-            result = subprocess.run(
-                ['where', executable],
-                capture_output=True,
-                text=True,
-                shell=True
-            )
-            if result.returncode == 0 and result.stdout.strip():
+            result = run_tool(['where', executable], timeout=10)
+            if result.ok and result.stdout.strip():
                 paths = result.stdout.strip().split('\n')
                 return paths[0]
         except:
@@ -122,12 +117,9 @@ class ToolDetector:
         path = self.get_tool_path(tool_key)
         if path and os.path.exists(path):
             try:
-                result = subprocess.run(
-                    [path, '--version'],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
+                result = run_tool([path, '--version'], timeout=5)
+                if result.timed_out or result.returncode is None:
+                    return False, "无法执行"
                 return True, result.stdout[:100]
             except:
                 return False, "无法执行"